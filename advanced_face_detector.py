@@ -7,6 +7,18 @@ import cv2
 import numpy as np
 from typing import List, Optional, Tuple
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads that decode and run MTCNN on images for batched detection; this also
+# bounds how many full-resolution frames are in memory at once
+DETECT_WORKERS = 4
+# Face crops sent through FaceNet per forward pass
+FACENET_BATCH_SIZE = 64
+# Decoded frames of photos with no faces found, kept so the AI-enhancement retry
+# that follows doesn't decode them again; each frame is handed out once
+NO_FACE_IMAGE_CACHE_SIZE = 8
 
 # Try to import advanced libraries, fallback gracefully if not available
 try:
@@ -24,6 +36,43 @@ try:
 except ImportError:
     _HAS_SKLEARN = False
 
+_no_face_images: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+_no_face_images_lock = threading.Lock()
+
+def _decode_image_rgb(image_path: str) -> Optional[np.ndarray]:
+    """Decode an image file to an RGB array"""
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def _keep_no_face_image(image_path: str, mtime_ns: int, img_rgb: np.ndarray) -> None:
+    """Hold on to the frame of a photo with no faces for the retry, evicting the oldest"""
+    with _no_face_images_lock:
+        _no_face_images[(image_path, mtime_ns)] = img_rgb
+        while len(_no_face_images) > NO_FACE_IMAGE_CACHE_SIZE:
+            _no_face_images.popitem(last=False)
+
+def load_image_rgb(image_path: str) -> Optional[np.ndarray]:
+    """
+    Load an image as RGB, taking the frame kept from detection when no faces were
+    found in it and the file is unchanged
+    """
+    try:
+        mtime_ns = os.stat(image_path).st_mtime_ns
+    except OSError:
+        return None
+    with _no_face_images_lock:
+        img_rgb = _no_face_images.pop((image_path, mtime_ns), None)
+    if img_rgb is not None:
+        return img_rgb
+    return _decode_image_rgb(image_path)
+
+def clear_decoded_images() -> None:
+    """Release frames kept for the retry once a pass over them is done"""
+    with _no_face_images_lock:
+        _no_face_images.clear()
+
 class AdvancedFaceDetector:
     """
     Advanced face detector with fallback to original system
@@ -73,65 +122,114 @@ class AdvancedFaceDetector:
         Advanced face detection with fallback to original system
         Returns list of face embeddings
         """
+        return self.detect_faces_batch([image_path])[0]
+    
+    def detect_faces_batch(self, image_paths: List[str]) -> List[List[np.ndarray]]:
+        """
+        Batched advanced face detection: images are decoded and searched for faces
+        in parallel, keeping only the 160x160 face crops, and the crops from all of
+        them go through FaceNet in fixed-size sub-batches.
+        Returns one list of face embeddings per input path.
+        """
         if not self.mtcnn or not self.facenet:
             # Fallback to original system
-            return self._fallback_detection(image_path)
+            return [self._fallback_detection(path) for path in image_paths]
         
-        try:
-            # Load image
-            img = cv2.imread(image_path)
-            if img is None:
+        results: List[List[np.ndarray]] = [[] for _ in image_paths]
+        face_tensors = []
+        owners = []
+        
+        # Decode + detect concurrently (OpenCV and torch release the GIL); each
+        # frame is dropped as soon as its faces are cropped
+        with ThreadPoolExecutor(max_workers=min(DETECT_WORKERS, len(image_paths) or 1)) as executor:
+            futures = [executor.submit(self._detect_face_tensors, path) for path in image_paths]
+        
+        for idx, (image_path, future) in enumerate(zip(image_paths, futures)):
+            try:
+                tensors = future.result()
+            except Exception as e:
+                print(f"⚠️ Advanced detection failed: {e}, falling back to 512D system")
+                results[idx] = self._fallback_512d_detection(image_path)
+                continue
+            if tensors is None:
                 print(f"⚠️ Could not load image: {image_path}")
-                return []
-            
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces with MTCNN
-            boxes, probs, landmarks = self.mtcnn.detect(img_rgb, landmarks=True)
-            
-            if boxes is None or len(boxes) == 0:
+                continue
+            if not tensors:
                 print(f"⚠️ No faces detected in {image_path}")
-                return []
-            
-            # Extract face crops and generate embeddings
-            embeddings = []
-            for i, box in enumerate(boxes):
-                if probs[i] > 0.9:  # High confidence threshold
-                    x1, y1, x2, y2 = box.astype(int)
-                    
-                    # Ensure valid face crop
-                    if x2 <= x1 or y2 <= y1 or x1 < 0 or y1 < 0:
-                        continue
-                        
-                    face = img_rgb[y1:y2, x1:x2]
-                    
-                    # Check if face crop is valid
-                    if face.size == 0 or face.shape[0] < 10 or face.shape[1] < 10:
-                        continue
-                    
-                    try:
-                        # Generate embedding with FaceNet
-                        face_tensor = self.mtcnn(face)
-                        if face_tensor is not None and face_tensor.numel() > 0:
-                            with torch.no_grad():
-                                embedding = self.facenet(face_tensor.unsqueeze(0))
-                                embedding = embedding.cpu().numpy().flatten()
-                                
-                                # Normalize embedding
-                                if _HAS_SKLEARN:
-                                    embedding = normalize(embedding.reshape(1, -1)).flatten()
-                                
-                                embeddings.append(embedding.astype(np.float32))
-                    except Exception as e:
-                        print(f"⚠️ Face processing failed for face {i}: {e}")
-                        continue
-            
-            print(f"✅ Detected {len(embeddings)} faces with advanced model")
-            return embeddings
-            
+            face_tensors.extend(tensors)
+            owners.extend([idx] * len(tensors))
+        
+        if not face_tensors:
+            return results
+        
+        try:
+            # Group photos can hold many faces, so FaceNet sees a bounded batch at a time
+            chunks = []
+            with torch.no_grad():
+                for start in range(0, len(face_tensors), FACENET_BATCH_SIZE):
+                    batch = torch.stack(face_tensors[start:start + FACENET_BATCH_SIZE]).to(self.device)
+                    chunks.append(self.facenet(batch).cpu().numpy())
+            embeddings = np.concatenate(chunks)
         except Exception as e:
             print(f"⚠️ Advanced detection failed: {e}, falling back to 512D system")
-            return self._fallback_512d_detection(image_path)
+            for idx in sorted(set(owners)):
+                results[idx] = self._fallback_512d_detection(image_paths[idx])
+            return results
+        
+        # Normalize embeddings
+        if _HAS_SKLEARN:
+            embeddings = normalize(embeddings)
+        
+        for owner, embedding in zip(owners, embeddings):
+            results[owner].append(embedding.astype(np.float32))
+        
+        print(f"✅ Detected {len(face_tensors)} faces in {len(image_paths)} images with advanced model")
+        return results
+    
+    def _detect_face_tensors(self, image_path: str) -> Optional[list]:
+        """Decode an image and return its face tensors, or None if it could not be loaded."""
+        try:
+            mtime_ns = os.stat(image_path).st_mtime_ns
+        except OSError:
+            return None
+        img_rgb = _decode_image_rgb(image_path)
+        if img_rgb is None:
+            return None
+        tensors = self._extract_face_tensors(img_rgb)
+        if not tensors:
+            _keep_no_face_image(image_path, mtime_ns, img_rgb)
+        return tensors
+    
+    def _extract_face_tensors(self, img_rgb: np.ndarray) -> list:
+        """Detect faces with MTCNN and return an aligned 3x160x160 tensor per confident face."""
+        boxes, probs, landmarks = self.mtcnn.detect(img_rgb, landmarks=True)
+        
+        if boxes is None or len(boxes) == 0:
+            return []
+        
+        tensors = []
+        for i, box in enumerate(boxes):
+            if probs[i] > 0.9:  # High confidence threshold
+                x1, y1, x2, y2 = box.astype(int)
+                
+                # Ensure valid face crop
+                if x2 <= x1 or y2 <= y1 or x1 < 0 or y1 < 0:
+                    continue
+                    
+                face = img_rgb[y1:y2, x1:x2]
+                
+                # Check if face crop is valid
+                if face.size == 0 or face.shape[0] < 10 or face.shape[1] < 10:
+                    continue
+                
+                try:
+                    face_tensor = self.mtcnn(face)
+                    if face_tensor is not None and face_tensor.numel() > 0:
+                        tensors.append(face_tensor)
+                except Exception as e:
+                    print(f"⚠️ Face processing failed for face {i}: {e}")
+                    continue
+        return tensors
     
     def _fallback_detection(self, image_path: str) -> List[np.ndarray]:
         """Fallback to original face_recognition system"""
@@ -212,6 +310,12 @@ def get_advanced_face_embeddings(image_path: str) -> List[np.ndarray]:
     """
     return advanced_detector.detect_faces_advanced(image_path)
 
+def get_advanced_face_embeddings_batch(image_paths: List[str]) -> List[List[np.ndarray]]:
+    """
+    Batched get_advanced_face_embeddings: one list of embeddings per image path
+    """
+    return advanced_detector.detect_faces_batch(image_paths)
+
 def compare_embeddings_advanced(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
     """
     Compare embeddings using advanced method with fallback
@@ -2,15 +2,25 @@
 drive_processor.py - Validate Google Drive URLs and download photos/folders.
 Requires a valid Google OAuth access token (user already authenticated).
 """
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import re
 import os
+import logging
 import requests
-from local_cache import save_bytes_to_cache, get_user_cache_dir, file_exists_in_cache, get_cached_file_path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from local_cache import (
+	save_bytes_to_cache, stream_to_cache, get_user_cache_dir, file_exists_in_cache, get_cached_file_path, list_cached_images,
+	find_cached_by_hash, record_content_hash, link_cached_file,
+)
 import pillow_heif
 from PIL import Image
 import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import islice
 
 # Try to import rawpy for RAW format support
 try:
@@ -20,17 +30,57 @@ except ImportError:
     RAWPY_AVAILABLE = False
     print("⚠️ rawpy not available - RAW files will be saved as-is")
 
-# Basic validators for Google Drive URLs - More flexible patterns
-_DRIVE_FILE_RE = re.compile(r"https?://drive\.google\.com/file/d/([\w-]+)")
-_DRIVE_FOLDER_RE = re.compile(r"https?://drive\.google\.com/drive/folders/([\w-]+)")
-# Additional patterns for various Google Drive URL formats
-_DRIVE_SHARED_RE = re.compile(r"https?://drive\.google\.com/drive/u/\d+/folders/([\w-]+)")
-_DRIVE_VIEW_RE = re.compile(r"https?://drive\.google\.com/open\?id=([\w-]+)")
-_DRIVE_SHORT_RE = re.compile(r"https?://drive\.google\.com/([\w-]+)")
-# More flexible patterns for different URL formats
-_DRIVE_FOLDER_ALT1 = re.compile(r"https?://drive\.google\.com/drive/folders/([^/?]+)")
-_DRIVE_FOLDER_ALT2 = re.compile(r"https?://drive\.google\.com/drive/folders/([^/?&\s]+)")
-_DRIVE_FOLDER_ALT3 = re.compile(r"https?://drive\.google\.com/drive/folders/([a-zA-Z0-9_-]+)")
+log = logging.getLogger(__name__)
+
+# Let PIL's Image.open decode HEIC/HEIF directly
+pillow_heif.register_heif_opener()
+
+# Shared HTTP session so every Drive call reuses pooled keep-alive connections
+# instead of paying a fresh TCP+TLS handshake per request.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+	pool_connections=16,
+	pool_maxsize=16,
+	max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+_SESSION.mount('https://', _ADAPTER)
+_SESSION.headers.update({'Accept-Encoding': 'gzip'})
+
+# Download threads mostly wait on sockets, so run one per pooled connection;
+# 429s from Drive are absorbed by the adapter's retry/backoff.
+_DOWNLOAD_MAX_WORKERS = 16
+# Per-file download progress is logged only for every Nth completion
+_PROGRESS_LOG_EVERY = 10
+
+# Max parent folder IDs OR-combined into a single Drive list query
+_LIST_BATCH_SIZE = 50
+# Concurrent list queries per BFS level; kept low to stay under Drive's per-user QPS
+_LIST_MAX_WORKERS = 8
+
+# Streamed downloads are written to the cache in chunks of this size
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Already-decodable formats that are cached untouched
+_PASSTHROUGH_EXTS = frozenset(('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'))
+# Extensions that are converted to JPG after download
+_HEIC_EXTS = frozenset(('.heic', '.heif'))
+_RAW_EXTS = frozenset(('.arw', '.cr2', '.cr3', '.nef', '.raf', '.orf', '.dng', '.rw2', '.pef', '.srw', '.kdc', '.dcr', '.mos', '.mrw', '.bay', '.erf', '.mef', '.raw', '.3fr', '.fff', '.hdr', '.x3f'))
+
+# HEIC/RAW decode + JPEG encode runs off the download threads. libheif, libraw and
+# libjpeg release the GIL while they work, so threads convert in parallel without
+# extra processes (each would re-import the app and its models). Shared by every
+# folder download in this process, so the worker count is capped.
+_CONVERT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+_CONVERT_POOL = ThreadPoolExecutor(max_workers=_CONVERT_MAX_WORKERS, thread_name_prefix="convert")
+# Conversions in flight per folder download; raw bytes for each are held in memory
+_MAX_PENDING_CONVERSIONS = 2 * _CONVERT_MAX_WORKERS
+
+# Single pass Google Drive URL matcher: file links capture `file`, folder/open links capture `folder`
+_DRIVE_RE = re.compile(
+	r"https?://drive\.google\.com/(?:file/d/(?P<file>[\w-]+)|(?:drive/(?:u/\d+/)?folders/|open\?id=)(?P<folder>[\w-]+))"
+)
+# Fallback: any long alphanumeric run that looks like a Drive ID
+_DRIVE_ID_RE = re.compile(r"[a-zA-Z0-9_-]{20,}")
 
 
 def validate_drive_url(url: str) -> Tuple[bool, str, str]:
@@ -38,52 +88,11 @@ def validate_drive_url(url: str) -> Tuple[bool, str, str]:
 	if not url:
 		return False, "empty", ""
 	
-	print(f"🔍 Validating URL: {url}")
-	
-	# Try all patterns in order of specificity
-	m = _DRIVE_FILE_RE.match(url)
-	if m:
-		print(f"✅ Matched as FILE with ID: {m.group(1)}")
-		return True, "file", m.group(1)
-	
-	m = _DRIVE_FOLDER_RE.match(url)
-	if m:
-		print(f"✅ Matched as FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	m = _DRIVE_SHARED_RE.match(url)
-	if m:
-		print(f"✅ Matched as SHARED FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	m = _DRIVE_VIEW_RE.match(url)
-	if m:
-		print(f"✅ Matched as VIEW FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	m = _DRIVE_SHORT_RE.match(url)
-	if m:
-		print(f"✅ Matched as SHORT FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	# Try more flexible patterns
-	m = _DRIVE_FOLDER_ALT1.match(url)
+	m = _DRIVE_RE.match(url)
 	if m:
-		print(f"✅ Matched as ALT1 FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	m = _DRIVE_FOLDER_ALT2.match(url)
-	if m:
-		print(f"✅ Matched as ALT2 FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	m = _DRIVE_FOLDER_ALT3.match(url)
-	if m:
-		print(f"✅ Matched as ALT3 FOLDER with ID: {m.group(1)}")
-		return True, "folder", m.group(1)
-	
-	# If no pattern matches, try to extract ID manually
-	print(f"❌ No regex pattern matched, trying manual extraction...")
+		if m.group("file"):
+			return True, "file", m.group("file")
+		return True, "folder", m.group("folder")
 	
 	# Look for folder ID in common patterns
 	if "folders/" in url:
@@ -91,19 +100,14 @@ def validate_drive_url(url: str) -> Tuple[bool, str, str]:
 		if len(parts) > 1:
 			folder_id = parts[1].split("?")[0].split("&")[0].split("/")[0]
 			if folder_id and len(folder_id) > 10:  # Google Drive IDs are usually long
-				print(f"✅ Manually extracted FOLDER ID: {folder_id}")
 				return True, "folder", folder_id
 	
 	# Look for any long alphanumeric string that might be an ID
-	import re
-	potential_ids = re.findall(r'[a-zA-Z0-9_-]{20,}', url)
-	if potential_ids:
-		for potential_id in potential_ids:
-			if len(potential_id) >= 20:  # Google Drive IDs are usually 20+ characters
-				print(f"✅ Found potential ID: {potential_id}")
-				return True, "folder", potential_id
+	m = _DRIVE_ID_RE.search(url)
+	if m:
+		return True, "folder", m.group(0)
 	
-	print(f"❌ Could not extract valid Drive ID from URL")
+	print(f"❌ Could not extract valid Drive ID from URL: {url}")
 	return False, "invalid", ""
 
 
@@ -112,10 +116,19 @@ def _headers(access_token: str) -> dict:
 
 
 def download_drive_file(user_id: str, folder_id: str, file_id: str, access_token: str, force_redownload: bool = False) -> str:
-	"""Download a single Drive file (image) and cache it. Returns local path."""
+	"""Download a single Drive file (image) and cache it. Returns local path.
+	Cached single-file URLs are returned before any network request is made."""
+	if not force_redownload and folder_id == file_id:
+		# Single-file URLs are cached in a folder named after the file itself,
+		# so any image already there is this file - no need to fetch its name
+		cached = list_cached_images(user_id, folder_id)
+		if cached:
+			print(f"✅ File already cached: {os.path.basename(cached[0])}")
+			return cached[0]
+	
 	# Get metadata to derive filename
-	meta_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?fields=id,name,mimeType"
-	r = requests.get(meta_url, headers=_headers(access_token))
+	meta_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?fields=name"
+	r = _SESSION.get(meta_url, headers=_headers(access_token))
 	r.raise_for_status()
 	meta = r.json()
 	name = meta.get("name", f"{file_id}.bin")
@@ -126,23 +139,71 @@ def download_drive_file(user_id: str, folder_id: str, file_id: str, access_token
 		return get_cached_file_path(user_id, folder_id, name)
 	
 	# Download content
-	dl_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-	r = requests.get(dl_url, headers=_headers(access_token), stream=True)
-	r.raise_for_status()
-	content = r.content
+	cached_path, content, content_hash = _fetch_drive_file(user_id, folder_id, file_id, name, access_token)
+	if cached_path:
+		return cached_path
 	
 	# Convert HEIC or RAW camera formats to JPG if needed
 	converted_content, converted_name = _convert_heic_if_needed(content, name)
 	
-	return save_bytes_to_cache(user_id, folder_id, converted_name, converted_content)
+	path = save_bytes_to_cache(user_id, folder_id, converted_name, converted_content)
+	record_content_hash(user_id, content_hash, path)
+	return path
+
+
+def _fetch_drive_file(user_id: str, folder_id: str, file_id: str, name: str, access_token: str) -> Tuple[Optional[str], Optional[bytes], str]:
+	"""Download a Drive file's content. Returns (cached_path, None, content_hash) when the
+	file is in the cache - streamed straight to disk, or linked to an identical file
+	downloaded earlier - or (None, content, content_hash) when it still needs conversion."""
+	hasher = hashlib.sha256()
+	dl_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+	with _SESSION.get(dl_url, headers=_headers(access_token), stream=True) as r:
+		r.raise_for_status()
+		
+		# Files that need no conversion go straight to disk without buffering
+		if not _needs_conversion(name):
+			def hashed_chunks():
+				for chunk in r.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+					hasher.update(chunk)
+					yield chunk
+			
+			path = stream_to_cache(user_id, folder_id, name, hashed_chunks())
+			content_hash = hasher.hexdigest()
+			duplicate = find_cached_by_hash(user_id, content_hash)
+			if duplicate:
+				# Same bytes already cached under another name: share the file
+				path = link_cached_file(user_id, folder_id, name, duplicate)
+			record_content_hash(user_id, content_hash, path)
+			return path, None, content_hash
+		
+		content = r.content
+	
+	hasher.update(content)
+	content_hash = hasher.hexdigest()
+	duplicate = find_cached_by_hash(user_id, content_hash)
+	if duplicate:
+		# Already converted once - link to that JPG and skip conversion entirely
+		linked_name = os.path.splitext(name)[0] + os.path.splitext(duplicate)[1]
+		path = link_cached_file(user_id, folder_id, linked_name, duplicate)
+		record_content_hash(user_id, content_hash, path)
+		return path, None, content_hash
+	return None, content, content_hash
+
+
+def _needs_conversion(filename: str) -> bool:
+	"""True if `_convert_heic_if_needed` would actually re-encode this file."""
+	ext = os.path.splitext(filename)[1].lower()
+	if ext in _HEIC_EXTS:
+		return True
+	return RAWPY_AVAILABLE and ext in _RAW_EXTS
 
 
 def get_folder_name(folder_id: str, access_token: str) -> str:
 	"""Get the name of a folder from its ID"""
 	try:
-		url = f"https://www.googleapis.com/drive/v3/files/{folder_id}"
+		url = f"https://www.googleapis.com/drive/v3/files/{folder_id}?fields=name"
 		headers = _headers(access_token)
-		response = requests.get(url, headers=headers)
+		response = _SESSION.get(url, headers=headers)
 		response.raise_for_status()
 		folder_data = response.json()
 		return folder_data.get('name', 'Unknown Folder')
@@ -150,63 +211,79 @@ def get_folder_name(folder_id: str, access_token: str) -> str:
 		print(f"⚠️ Could not get folder name for {folder_id}: {e}")
 		return f"Folder {folder_id}"
 
-def list_folder_files(folder_id: str, access_token: str) -> List[dict]:
-	"""List files in a Drive folder (images only) - recursively searches subfolders."""
-	from progress_tracker import update_folder_info, should_stop_processing
-	def search_recursively(current_folder_id: str, depth: int = 0) -> List[dict]:
-		"""Recursively search for image files in folder and all subfolders."""
-		if depth > 10:  # Prevent infinite recursion, max 10 levels deep
-			print(f"⚠️  Reached maximum depth ({depth}) for folder {current_folder_id}")
-			return []
-		
-		all_files = []
-		
-		# Query for both files and folders in current directory
-		q = f"'{current_folder_id}' in parents and trashed=false"
-		fields = "files(id,name,mimeType,parents),nextPageToken"
-		url = f"https://www.googleapis.com/drive/v3/files?q={requests.utils.quote(q)}&fields={fields}&pageSize=1000"
+def _list_children(parent_ids: List[str], access_token: str) -> List[dict]:
+	"""List every non-trashed child of any of `parent_ids` with one OR-combined query (paged)."""
+	parents_q = " or ".join(f"'{pid}' in parents" for pid in parent_ids)
+	q = f"({parents_q}) and trashed=false"
+	fields = "files(id,name,mimeType),nextPageToken"
+	url = f"https://www.googleapis.com/drive/v3/files?q={requests.utils.quote(q)}&fields={fields}&pageSize=1000"
+	
+	children = []
+	page_token = None
+	while True:
+		u = url
+		if page_token:
+			u += f"&pageToken={page_token}"
 		
-		page_token = None
-		while True:
-			u = url
-			if page_token:
-				u += f"&pageToken={page_token}"
-			
-			r = requests.get(u, headers=_headers(access_token))
-			r.raise_for_status()
-			data = r.json()
-			
-			for f in data.get("files", []):
-				mt = f.get("mimeType", "")
-				
-				if mt.startswith("image/"):
-					# This is an image file
-					all_files.append(f)
-					print(f"  {'  ' * depth}📷 Found image: {f.get('name', 'Unknown')}")
-				elif mt == "application/vnd.google-apps.folder":
-					# This is a subfolder, search it recursively
-					subfolder_name = f.get('name', 'Unknown')
-					print(f"  {'  ' * depth}📁 Searching subfolder: {subfolder_name}")
-					
-					# Update progress with real folder name
-					update_folder_info(folder_path=f"Searching subfolder: {subfolder_name}")
-					
-					subfolder_files = search_recursively(f["id"], depth + 1)
-					all_files.extend(subfolder_files)
-			
-			page_token = data.get("nextPageToken")
-			if not page_token:
-				break
+		r = _SESSION.get(u, headers=_headers(access_token))
+		r.raise_for_status()
+		data = r.json()
+		children.extend(data.get("files", []))
 		
-		return all_files
+		page_token = data.get("nextPageToken")
+		if not page_token:
+			break
+	
+	return children
+
+
+def list_folder_files(folder_id: str, access_token: str) -> List[dict]:
+	"""List files in a Drive folder (images only) - searches all subfolders breadth-first.
+	
+	Each BFS level is fetched with queries that OR together up to
+	_LIST_BATCH_SIZE parent IDs, so deep trees cost O(folders/50) requests
+	instead of one request per folder. The chunks of a level run concurrently.
+	"""
+	from progress_tracker import update_folder_info, should_stop_processing
 	
 	# Get the main folder name
 	main_folder_name = get_folder_name(folder_id, access_token)
 	print(f"🔍 Starting recursive search in folder: {main_folder_name}")
 	update_folder_info(folder_path=f"Scanning folder: {main_folder_name}")
 	
-	files = search_recursively(folder_id)
-	print(f"📋 Found {len(files)} total image files (including subfolders)")
+	files = []
+	seen_folders = {folder_id}
+	frontier = [folder_id]
+	depth = 0
+	with ThreadPoolExecutor(max_workers=_LIST_MAX_WORKERS) as executor:
+		while frontier:
+			next_frontier = []
+			it = iter(frontier)
+			# Fetch every chunk of this level concurrently
+			futures = [
+				executor.submit(_list_children, chunk, access_token)
+				for chunk in iter(lambda: list(islice(it, _LIST_BATCH_SIZE)), [])
+			]
+			for future in as_completed(futures):
+				for f in future.result():
+					mt = f.get("mimeType", "")
+					
+					if mt.startswith("image/"):
+						# This is an image file
+						files.append(f)
+					elif mt == "application/vnd.google-apps.folder" and f["id"] not in seen_folders:
+						# This is a subfolder, queue it for the next level
+						seen_folders.add(f["id"])
+						subfolder_name = f.get('name', 'Unknown')
+						log.debug("Searching subfolder: %s (depth %d)", subfolder_name, depth)
+						
+						# Update progress with real folder name
+						update_folder_info(folder_path=f"Searching subfolder: {subfolder_name}")
+						next_frontier.append(f["id"])
+			frontier = next_frontier
+			depth += 1
+	
+	log.info("Found %d images under %s (including subfolders)", len(files), folder_id)
 	
 	# Update progress with scanning completion
 	update_folder_info(folder_path=f"Scanning complete! Found {len(files)} images")
@@ -215,12 +292,21 @@ def list_folder_files(folder_id: str, access_token: str) -> List[dict]:
 	return files
 
 
-def download_drive_folder(user_id: str, folder_id: str, access_token: str, force_redownload: bool = False) -> List[str]:
-	"""Download all image files from a Drive folder; returns local paths."""
+def download_drive_folder(user_id: str, folder_id: str, access_token: str, force_redownload: bool = False,
+		files: Optional[List[dict]] = None, ready_queue: Optional["queue.Queue[str]"] = None,
+		stop_event: Optional[threading.Event] = None) -> List[str]:
+	"""Download all image files from a Drive folder; returns local paths.
+	
+	Pass `files` to reuse an existing list_folder_files result. If `ready_queue` is
+	given, each local path is also put on it as soon as the file is in the cache,
+	so a consumer can start on it while the rest of the folder downloads. Setting
+	`stop_event` cancels the remaining downloads, e.g. when that consumer fails.
+	"""
 	from progress_tracker import update_folder_info, should_stop_processing, set_total, set_status, increment
 	
-	print(f"📂 Listing files in Google Drive folder...")
-	files = list_folder_files(folder_id, access_token)
+	if files is None:
+		print(f"📂 Listing files in Google Drive folder...")
+		files = list_folder_files(folder_id, access_token)
 	print(f"📋 Found {len(files)} image files in folder")
 	
 	# Update progress to show downloading phase
@@ -253,7 +339,9 @@ def download_drive_folder(user_id: str, folder_id: str, access_token: str, force
 		cached_path = get_cached_file_path(user_id, folder_id, filename)
 		if cached_path:
 			paths.append(cached_path)
-			print(f"✅ Using cached: {filename}")
+			if ready_queue is not None:
+				ready_queue.put(cached_path)
+			log.debug("Using cached: %s", filename)
 			try:
 				increment('download')
 				set_status('download', f"Preparing ({len(paths)}/{len(files)})")
@@ -262,52 +350,93 @@ def download_drive_folder(user_id: str, folder_id: str, access_token: str, force
 	
 	# Download new files concurrently
 	if new_files:
-		print(f"🚀 Starting concurrent downloads with {min(5, len(new_files))} workers...")
+		max_workers = min(_DOWNLOAD_MAX_WORKERS, len(new_files))
+		print(f"🚀 Starting concurrent downloads with {max_workers} workers...")
 		
 		def download_single_file(file_info):
-			"""Download a single file - used by ThreadPoolExecutor"""
+			"""Download a single file - used by ThreadPoolExecutor.
+			HEIC/RAW files come back as raw bytes so conversion can run on the conversion pool."""
 			try:
 				filename = file_info.get('name', 'Unknown')
 				file_id = file_info.get('id')
-				print(f"  📥 Downloading: {filename}")
-				p = download_drive_file(user_id, folder_id, file_id, access_token, force_redownload)
-				print(f"     ✅ Downloaded: {filename}")
-				return p, filename, None  # success
+				log.debug("Downloading: %s", filename)
+				p, content, content_hash = _fetch_drive_file(user_id, folder_id, file_id, filename, access_token)
+				log.debug("Downloaded: %s", filename)
+				return p, content, content_hash, filename, None  # success
 			except Exception as e:
-				print(f"     ❌ Failed to download {file_info.get('name')} ({file_info.get('id')}): {e}")
-				return None, file_info.get('name'), str(e)  # failure
+				log.warning("Failed to download %s (%s): %s", file_info.get('name'), file_info.get('id'), e)
+				return None, None, None, file_info.get('name'), str(e)  # failure
 		
-		# Use ThreadPoolExecutor for concurrent downloads
-		max_workers = min(5, len(new_files))  # Limit to 5 concurrent downloads to avoid rate limits
+		def file_ready(file_path, filename):
+			"""Record a file that has landed in the cache and update progress."""
+			paths.append(file_path)
+			if ready_queue is not None:
+				ready_queue.put(file_path)
+			update_folder_info(folder_path=f"Downloading: {filename} ({len(paths)}/{len(files)})")
+			try:
+				increment('download')
+				set_status('download', f"Downloading {len(paths)}/{len(files)}")
+			except Exception:
+				pass
+		
+		def conversion_done(future, filename, content_hash):
+			"""Cache a file that came back from the conversion pool."""
+			try:
+				converted_content, converted_name = future.result()
+				converted_path = save_bytes_to_cache(user_id, folder_id, converted_name, converted_content)
+				record_content_hash(user_id, content_hash, converted_path)
+				file_ready(converted_path, filename)
+				log.debug("Converted and cached: %s", filename)
+			except Exception as e:
+				log.warning("Failed to cache converted %s: %s", filename, e)
+		
+		# Use ThreadPoolExecutor for concurrent downloads; HEIC/RAW conversions go to
+		# the conversion pool and are cached as they finish, while downloads continue.
+		# Downloads are submitted a few at a time and held back while the conversion
+		# pool is saturated, so raw bytes for the whole folder never sit in memory.
 		with ThreadPoolExecutor(max_workers=max_workers) as executor:
-			# Submit all download tasks
-			future_to_file = {executor.submit(download_single_file, f): f for f in new_files}
-			
-			# Process completed downloads
+			remaining_files = iter(new_files)
+			download_futures = set()
+			convert_futures = {}
 			completed_count = 0
-			for future in as_completed(future_to_file):
+			while True:
+				if len(convert_futures) < _MAX_PENDING_CONVERSIONS:
+					for f in islice(remaining_files, 2 * max_workers - len(download_futures)):
+						download_futures.add(executor.submit(download_single_file, f))
+				if not download_futures and not convert_futures:
+					break
+				done, _ = wait(download_futures | set(convert_futures), return_when=FIRST_COMPLETED)
+				
 				# Check if processing should be stopped
+				if stop_event is not None and stop_event.is_set():
+					log.info("Download cancelled after %d/%d files", completed_count, len(new_files))
+					for pending in download_futures | set(convert_futures):
+						pending.cancel()
+					break
 				if should_stop_processing():
 					print("🛑 Download stopped by user")
 					update_folder_info(folder_path="Download stopped by user")
+					for pending in download_futures | set(convert_futures):
+						pending.cancel()
 					break
-					
-				completed_count += 1
-				file_path, filename, error = future.result()
 				
-				if file_path:
-					paths.append(file_path)
-					print(f"  [{completed_count}/{len(new_files)}] ✅ Completed: {filename}")
+				for future in done:
+					if future in convert_futures:
+						conversion_done(future, *convert_futures.pop(future))
+						continue
+					
+					download_futures.discard(future)
+					completed_count += 1
+					file_path, content, content_hash, filename, error = future.result()
 					
-					# Update progress with current download status
-					update_folder_info(folder_path=f"Downloading: {filename} ({completed_count}/{len(new_files)})")
-					try:
-						increment('download')
-						set_status('download', f"Downloading {len(paths)}/{len(files)}")
-					except Exception:
-						pass
-				else:
-					print(f"  [{completed_count}/{len(new_files)}] ❌ Failed: {filename} - {error}")
+					if file_path:
+						if completed_count % _PROGRESS_LOG_EVERY == 0:
+							log.info("Downloaded %d/%d: %s", completed_count, len(new_files), filename)
+						file_ready(file_path, filename)
+					elif content is not None:
+						convert_futures[_CONVERT_POOL.submit(_convert_heic_if_needed, content, filename)] = (filename, content_hash)
+					else:
+						log.warning("Failed %d/%d: %s - %s", completed_count, len(new_files), filename, error)
 		
 		# Update progress with download completion
 		update_folder_info(folder_path=f"Downloaded {len(paths)} photos successfully!")
@@ -322,28 +451,21 @@ def download_drive_folder(user_id: str, folder_id: str, access_token: str, force
 
 def _convert_heic_if_needed(content: bytes, filename: str) -> Tuple[bytes, str]:
 	"""Convert HEIC or RAW camera formats to JPG if needed. Returns (converted_content, converted_filename)."""
+	ext = os.path.splitext(filename)[1].lower()
+	# Common web formats never need conversion - skip everything below
+	if ext in _PASSTHROUGH_EXTS:
+		return content, filename
+	
+	# Check if file is HEIC or RAW by extension
+	is_heic = ext in _HEIC_EXTS
+	is_raw = ext in _RAW_EXTS
+	format_type = "HEIC" if is_heic else "RAW" if is_raw else "Image"
+	
 	try:
-		# Check if file is HEIC or RAW by extension
-		lower_filename = filename.lower()
-		is_heic = lower_filename.endswith(('.heic', '.heif')) or lower_filename.endswith(('.HEIC', '.HEIF'))
-		is_raw = lower_filename.endswith(('.arw', '.cr2', '.cr3', '.nef', '.raf', '.orf', '.dng', '.rw2', '.pef', '.srw', '.kdc', '.dcr', '.mos', '.mrw', '.bay', '.erf', '.mef', '.raw', '.3fr', '.fff', '.hdr', '.x3f'))
-		
 		if is_heic or is_raw:
-			format_type = "HEIC" if is_heic else "RAW"
-			print(f"🔄 Converting {format_type} to JPG: {filename}")
+			log.debug("Converting %s to JPG: %s", format_type, filename)
 			
-			if is_heic:
-				# Open HEIC image using pillow_heif
-				heif_file = pillow_heif.read_heif(content)
-				image = Image.frombytes(
-					heif_file.mode, 
-					heif_file.size, 
-					heif_file.data,
-					"raw",
-					heif_file.mode,
-					heif_file.stride,
-				)
-			elif is_raw and RAWPY_AVAILABLE:
+			if is_raw and RAWPY_AVAILABLE:
 				# Open RAW image using rawpy for proper RAW format support
 				with rawpy.imread(io.BytesIO(content)) as raw:
 					# Process RAW with default settings
@@ -351,32 +473,32 @@ def _convert_heic_if_needed(content: bytes, filename: str) -> Tuple[bytes, str]:
 					image = Image.fromarray(rgb)
 			elif is_raw and not RAWPY_AVAILABLE:
 				# RAW conversion not available
-				print(f"⚠️ RAW conversion not available (rawpy not installed) - saving {filename} as-is")
+				log.warning("RAW conversion not available (rawpy not installed) - saving %s as-is", filename)
 				return content, filename
 			else:
-				# Fallback for other formats
+				# HEIC decodes straight into a PIL image via the registered HEIF opener
 				image = Image.open(io.BytesIO(content))
 			
 			# Convert to RGB if needed (RAW/HEIC might be in different color spaces)
 			if image.mode in ('RGBA', 'LA', 'P', 'CMYK', 'LAB', 'HSV', 'YCbCr'):
 				image = image.convert('RGB')
 			
-			# Save as JPG to bytes
+			# Save as JPG to bytes. No optimize pass (a second encode for ~2-5% size) and
+			# explicit 4:2:0 subsampling - quality 90 is ample for face detection downstream.
 			output_buffer = io.BytesIO()
-			image.save(output_buffer, format='JPEG', quality=95, optimize=True)
+			image.save(output_buffer, format='JPEG', quality=90, optimize=False, progressive=False, subsampling=2)
 			converted_content = output_buffer.getvalue()
 			
 			# Update filename from original extension to .jpg
 			converted_name = os.path.splitext(filename)[0] + '.jpg'
 			
-			print(f"✅ Converted {filename} to {converted_name}")
+			log.debug("Converted %s to %s", filename, converted_name)
 			return converted_content, converted_name
 		
 		# Not HEIC or RAW, return original content and filename
 		return content, filename
 		
 	except Exception as e:
-		print(f"⚠️ {format_type if 'format_type' in locals() else 'Image'} conversion failed for {filename}: {e}")
-		print(f"   Saving original file as-is")
+		log.warning("%s conversion failed for %s: %s - saving original file as-is", format_type, filename, e)
 		# If conversion fails, return original content and filename
 		return content, filename
@@ -17,7 +17,7 @@ except ImportError:
 
 # Import our new modules
 try:
-    from advanced_face_detector import get_advanced_face_embeddings, compare_embeddings_advanced
+    from advanced_face_detector import get_advanced_face_embeddings, get_advanced_face_embeddings_batch, compare_embeddings_advanced, load_image_rgb, clear_decoded_images
     from ai_enhancements import enhance_face_for_recognition
     _HAS_ENHANCED_FEATURES = True
     print("✅ Enhanced features available")
@@ -59,6 +59,38 @@ def embed_image_file_enhanced(path: str, use_ai_enhancements: bool = True) -> Li
     except Exception as e:
         print(f"⚠️ Enhanced embedding failed: {e}, falling back to 512D system")
         return _fallback_512d_embedding(path)
+    finally:
+        clear_decoded_images()
+
+def embed_image_files_batch_enhanced(paths: List[str], use_ai_enhancements: bool = True) -> List[List[np.ndarray]]:
+    """
+    Batched embed_image_file_enhanced: all faces found in `paths` are embedded together
+    Args:
+        paths: Paths to image files
+        use_ai_enhancements: Whether to retry photos with no faces using AI enhancements
+    Returns:
+        One list of face embeddings per path
+    """
+    if not _HAS_ENHANCED_FEATURES:
+        return [_fallback_512d_embedding(path) for path in paths]
+    
+    try:
+        results = get_advanced_face_embeddings_batch(paths)
+    except Exception as e:
+        print(f"⚠️ Batched embedding failed: {e}, embedding photos one at a time")
+        return [embed_image_file_enhanced(path, use_ai_enhancements) for path in paths]
+    
+    try:
+        if use_ai_enhancements:
+            for i, path in enumerate(paths):
+                if not results[i]:
+                    # Try with AI enhancements if no faces found
+                    results[i] = _try_with_ai_enhancements(path)
+    finally:
+        # Decoded images are only reused within this batch - don't hold them between batches
+        clear_decoded_images()
+    
+    return results
 
 def _try_with_ai_enhancements(path: str) -> List[np.ndarray]:
     """Try face detection with AI enhancements"""
@@ -67,13 +99,11 @@ def _try_with_ai_enhancements(path: str) -> List[np.ndarray]:
         return []
         
     try:
-        # Load image
-        img = cv2.imread(path)
-        if img is None:
+        # Load image (usually the frame kept from the detection pass)
+        img_rgb = load_image_rgb(path)
+        if img_rgb is None:
             return []
         
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
         # Apply AI enhancements
         enhanced_img = enhance_face_for_recognition(img_rgb)
         
@@ -3,7 +3,7 @@ firebase_store.py - Save and query face embeddings and metadata in Firebase Fire
 """
 import os
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -59,6 +59,7 @@ def initialize_firebase():
 db = initialize_firebase()
 
 FACES_COLLECTION = 'faces'
+FIRESTORE_BATCH_LIMIT = 500
 
 
 def save_face_embedding(user_id: str, photo_ref: str, embedding: np.ndarray) -> bool:
@@ -90,6 +91,40 @@ def save_face_embedding(user_id: str, photo_ref: str, embedding: np.ndarray) ->
         return False
 
 
+def save_face_embeddings_batch(user_id: str, items: List[Tuple[str, np.ndarray]]) -> int:
+    """Persist many (photo_ref, embedding) pairs with batched writes.
+    Returns number saved; on failure these are the leading items, committed before it."""
+    saved = 0
+    try:
+        if db is None:
+            print(f"⚠️ No Firebase client; simulate batch save of {len(items)} embeddings")
+            return len(items)
+        
+        collection = db.collection(FACES_COLLECTION)
+        # Firestore caps a write batch at 500 operations
+        for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            chunk = items[start:start + FIRESTORE_BATCH_LIMIT]
+            batch = db.batch()
+            for photo_ref, embedding in chunk:
+                embedding_list = embedding.tolist()
+                batch.set(collection.document(), {
+                    'user_id': user_id,
+                    'photo_reference': photo_ref,
+                    'face_embedding': embedding_list,
+                    'embedding_dimension': len(embedding_list),
+                    'created_at': firestore.SERVER_TIMESTAMP
+                })
+            batch.commit()
+            saved += len(chunk)
+        
+        print(f"✅ Saved {saved} face embeddings in batch")
+        return saved
+        
+    except Exception as e:
+        print(f"❌ save_face_embeddings_batch error: {e}")
+        return saved
+
+
 def fetch_embeddings_for_user(user_id: str) -> List[Dict[str, Any]]:
     """Fetch all face records for a user."""
     try:
@@ -4,7 +4,7 @@ This simulates Firebase operations locally until proper credentials are set up.
 """
 import os
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import numpy as np
 from datetime import datetime
@@ -54,6 +54,11 @@ def save_face_embedding(user_id: str, photo_ref: str, embedding: np.ndarray) ->
         return False
 
 
+def save_face_embeddings_batch(user_id: str, items: List[Tuple[str, np.ndarray]]) -> int:
+    """Persist many (photo_ref, embedding) pairs. Returns number saved."""
+    return sum(1 for photo_ref, embedding in items if save_face_embedding(user_id, photo_ref, embedding))
+
+
 def fetch_embeddings_for_user(user_id: str) -> List[Dict[str, Any]]:
     """Fetch all face records for a user."""
     try:
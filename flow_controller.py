@@ -1,19 +1,38 @@
 """
 flow_controller.py - Orchestrates Drive download, embedding, Supabase storage, and search
 """
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Optional
+import logging
 import os
+import queue
+import threading
 
-from drive_processor import validate_drive_url, download_drive_folder, download_drive_file
-from enhanced_embedding_engine import embed_image_file_enhanced as embed_image_file
-from firebase_store import save_face_embedding
+from drive_processor import validate_drive_url, list_folder_files, download_drive_folder, download_drive_file
+from enhanced_embedding_engine import embed_image_files_batch_enhanced as embed_image_files
+from firebase_store import save_face_embeddings_batch
 from selfie_handler import process_selfies
 from search_engine import rank_matches_for_user
-from local_cache import embedding_exists_in_cache, load_embedding_from_cache, save_embedding_to_cache
+from local_cache import load_embedding_from_cache, save_embedding_to_cache, list_cached_embeddings, embedding_cache_key, get_content_hash, find_cached_by_hash
 
 
 
 
+log = logging.getLogger(__name__)
+
+# Per-photo progress is logged only for every Nth photo
+PROGRESS_LOG_EVERY = 10
+
+# Photos are sent through face detection/embedding in batches of this size
+EMBED_BATCH_SIZE = 32
+# Downloaded paths waiting to be embedded; a full queue pauses the downloader
+PIPELINE_QUEUE_SIZE = 32
+# Embed a partial batch once this many photos are ready and nothing else has landed
+PIPELINE_MIN_BATCH = 16
+
+# Face embeddings are buffered and written to the store in batches of this size
+STORE_BATCH_SIZE = 100
+
+
 class FlowError(Exception):
 	pass
 
@@ -48,18 +67,38 @@ def process_drive_folder_and_store(user_id: str, url: str, access_token: str, fo
 	update_folder_info(folder_path=f"Processing Google Drive folder...")
 	
 	paths: List[str] = []
+	ready: Optional["queue.Queue[Optional[str]]"] = None
+	downloader: Optional[threading.Thread] = None
+	download_errors: List[BaseException] = []
+	# Set once nothing will consume further downloads
+	stop_downloads = threading.Event()
 	if kind == "folder":
 		print(f"📁 Downloading folder contents...")
-		paths = download_drive_folder(user_id, rid, access_token, force_redownload=force_reprocess)
-		print(f"📥 Processed {len(paths)} files")
+		files = list_folder_files(rid, access_token)
+		expected_count = len(files)
 		
-		# Update with actual file count
-		update_folder_info(files_found=len(paths), total_files=len(paths))
+		# Download in the background and embed photos as they land
+		ready = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+		
+		def run_download() -> None:
+			try:
+				paths.extend(download_drive_folder(user_id, rid, access_token, force_redownload=force_reprocess,
+					files=files, ready_queue=ready, stop_event=stop_downloads))
+			except BaseException as e:
+				download_errors.append(e)
+			finally:
+				ready.put(None)  # end of downloads
+		
+		downloader = threading.Thread(target=run_download, name="drive-folder-download", daemon=True)
+		downloader.start()
+		ready_paths: Iterator[str] = iter(ready.get, None)
 	elif kind == "file":
 		print(f"📄 Downloading single file...")
 		# For single files, use the file_id as folder_id to keep them organized
 		p = download_drive_file(user_id, rid, rid, access_token, force_redownload=force_reprocess)
 		paths = [p]
+		expected_count = 1
+		ready_paths = iter(paths)
 		print(f"📥 Processed file: {p}")
 	else:
 		print(f"❌ Unsupported Drive URL type: {kind}")
@@ -69,83 +108,162 @@ def process_drive_folder_and_store(user_id: str, url: str, access_token: str, fo
 	
 	# Step 2: Processing photos
 	set_status('processing', 'Starting photo processing...')
-	set_total('processing', len(paths))
+	set_total('processing', expected_count)
 	
-	print(f"🔄 Processing {len(paths)} photos for face detection...")
+	print(f"🔄 Processing {expected_count} photos for face detection...")
 	embedded = 0
 	skipped = 0
+	queued = 0
+	pending: List[Tuple[str, Any]] = []
 	
-	# Update progress to show face embedding phase
-	update_folder_info(folder_path=f"Now processing {len(paths)} photos for face detection...")
-	
-	for i, p in enumerate(paths, 1):
-		# Check if processing should be stopped
-		if should_stop_processing():
-			print("🛑 Processing stopped by user")
-			update_folder_info(folder_path="Processing stopped by user")
-			break
+	def flush_pending() -> None:
+		"""Write buffered embeddings to the store in one batch, then cache the ones it accepted.
+		Only stored embeddings are cached locally, since a cached photo is skipped next run."""
+		nonlocal embedded
+		if not pending:
+			return
+		set_status('storage', f'Storing {len(pending)} face embeddings')
+		saved = save_face_embeddings_batch(user_id, pending)
+		for photo_ref, face_embedding in pending[:saved]:
+			local_cache_path = save_embedding_to_cache(user_id, photo_ref, face_embedding)
+			log.debug("Saved to local cache: %s", local_cache_path)
+		if saved:
+			embedded += saved
+			increment('embedding', saved)
+			increment('storage', saved)
+			log.debug("Stored %d face embeddings", saved)
+		if saved < len(pending):
+			log.warning("Failed to store %d face embeddings", len(pending) - saved)
+		pending.clear()
+	
+	photo_batch: List[str] = []
+	
+	def embed_photo_batch() -> None:
+		"""Detect and embed faces for every photo in the batch, then queue them for the store."""
+		nonlocal queued
+		set_status('face_detection', f'Detecting faces in {len(photo_batch)} photos')
+		face_lists = embed_image_files(photo_batch)
+		increment('face_detection', len(photo_batch))
+		
+		for p, faces in zip(photo_batch, face_lists):
+			photo_ref = os.path.basename(p)
+			log.debug("Found %d faces in %s", len(faces), photo_ref)
 			
+			if faces:
+				# Step 4: Creating embeddings
+				queued += len(faces)
+				set_status('embedding', f'Creating embeddings for {len(faces)} faces')
+				set_total('embedding', queued)
+				set_total('storage', queued)
+				
+				# Queue embeddings for the store; they reach the local cache once stored
+				for face_embedding in faces:
+					pending.append((photo_ref, face_embedding))
+				
+				# Step 5: Storing in database
+				if len(pending) >= STORE_BATCH_SIZE:
+					flush_pending()
+			else:
+				log.debug("No faces detected in %s", photo_ref)
+			# Photo completed (processed path with or without faces)
+			increment('processing')
+		photo_batch.clear()
+	
+	# List the embedding cache once instead of checking each photo on disk
+	cached_embeddings = set() if force_reprocess else set(list_cached_embeddings(user_id))
+	# Content hashes of photos already queued for embedding in this run
+	embedded_hashes = set()
+	
+	def process_ready_photo(i: int, p: str) -> None:
+		"""Skip or queue a photo for embedding as soon as it is in the local cache."""
+		nonlocal skipped
 		photo_ref = os.path.basename(p)
-		print(f"  [{i}/{len(paths)}] Processing: {photo_ref}")
-		set_status('processing', f'Processing photo {i}/{len(paths)}')
+		if i % PROGRESS_LOG_EVERY == 0:
+			log.info("Processing %d/%d: %s", i, expected_count, photo_ref)
+		set_status('processing', f'Processing photo {i}/{expected_count}')
 		
 		# Update progress with current file being processed
-		update_folder_info(folder_path=f"Face detection: {photo_ref} ({i}/{len(paths)})")
+		update_folder_info(folder_path=f"Face detection: {photo_ref} ({i}/{expected_count})")
 		
 		# Skip macOS system files (._ prefix)
 		if photo_ref.startswith('._'):
-			print(f"     ⚠️ Skipping macOS system file: {photo_ref}")
+			log.debug("Skipping macOS system file: %s", photo_ref)
 			skipped += 1
 			# Count this photo as progressed (considered) even if skipped
 			increment('processing')
-			continue
+			return
 		
 		# Check if embeddings already exist for this photo
-		# Use the full path for embedding cache checks, not just the filename
-		if not force_reprocess and embedding_exists_in_cache(user_id, p):
-			print(f"     ✅ Embeddings already cached for {photo_ref}")
+		if embedding_cache_key(photo_ref) in cached_embeddings:
+			log.debug("Embeddings already cached for %s", photo_ref)
 			skipped += 1
 			# Count this photo as progressed (considered) even if skipped
 			increment('processing')
-			continue
-		
-		# Step 3: Face detection
-		set_status('face_detection', f'Detecting faces in {photo_ref}')
-		set_total('face_detection', len(paths))
-		increment('face_detection')
+			return
 		
-		# Process the photo for face detection
-		faces = embed_image_file(p)
-		print(f"     Found {len(faces)} faces")
+		# Same bytes as a photo embedded earlier (a duplicate under another name)
+		content_hash = get_content_hash(user_id, p)
+		if content_hash:
+			source = find_cached_by_hash(user_id, content_hash)
+			if content_hash in embedded_hashes or (source and source != p and embedding_cache_key(os.path.basename(source)) in cached_embeddings):
+				log.debug("Skipping duplicate photo %s", photo_ref)
+				skipped += 1
+				increment('processing')
+				return
+			embedded_hashes.add(content_hash)
 		
-		if faces:
-			# Step 4: Creating embeddings
-			set_status('embedding', f'Creating embeddings for {len(faces)} faces')
-			set_total('embedding', len(faces))
-			set_total('storage', len(faces))
+		# Step 3: Face detection (photos are embedded a batch at a time)
+		set_total('face_detection', expected_count)
+		photo_batch.append(p)
+	
+	# Update progress to show face embedding phase
+	update_folder_info(folder_path=f"Now processing {expected_count} photos for face detection...")
+	
+	i = 0
+	stopped = False
+	try:
+		for p in ready_paths:
+			# Check if processing should be stopped
+			if stopped or should_stop_processing():
+				if not stopped:
+					print("🛑 Processing stopped by user")
+					update_folder_info(folder_path="Processing stopped by user")
+					stopped = True
+				# Keep draining so the downloader is never left blocked on a full queue
+				continue
 			
-			# Save embeddings to both local cache and Supabase
-			for face_idx, face_embedding in enumerate(faces):
-				
-				# Save to local cache first for faster access
-				local_cache_path = save_embedding_to_cache(user_id, photo_ref, face_embedding)
-				print(f"     💾 Saved to local cache: {local_cache_path}")
-				
-				# Step 5: Storing in database
-				set_status('storage', f'Storing face {face_idx + 1}/{len(faces)}')
-				
-				# Also save to Supabase for persistence
-				if save_face_embedding(user_id, photo_ref, face_embedding):
-					embedded += 1
-					increment('embedding')
-					increment('storage')
-					print(f"     ✅ Saved face embedding {face_idx + 1} for {photo_ref}")
-				else:
-					print(f"     ❌ Failed to save face embedding {face_idx + 1} for {photo_ref}")
-		else:
-			print(f"     ⚠️ No faces detected in {photo_ref}")
-		# Photo completed (processed path with or without faces)
-		increment('processing')
+			i += 1
+			process_ready_photo(i, p)
+			
+			# Embed a full batch, or a partial one when no other download is waiting
+			if len(photo_batch) >= EMBED_BATCH_SIZE or (
+					len(photo_batch) >= PIPELINE_MIN_BATCH and (ready is None or ready.empty())):
+				embed_photo_batch()
+	finally:
+		if downloader is not None:
+			# If embedding failed part way, cancel the remaining downloads and drain
+			# what is already in flight so the downloader is never left blocked
+			stop_downloads.set()
+			for _ in ready_paths:
+				pass
+			downloader.join()
+		# Store what was already embedded even if the run failed part way
+		flush_pending()
+	
+	if download_errors:
+		raise download_errors[0]
+	if kind == "folder":
+		print(f"📥 Processed {len(paths)} files")
+		
+		# Update with actual file count
+		update_folder_info(files_found=len(paths), total_files=len(paths))
+	
+	try:
+		if photo_batch and not should_stop_processing():
+			embed_photo_batch()
+	finally:
+		# Store whatever is left in the buffer
+		flush_pending()
 	
 	total_count = len(paths)
 	result = {
@@ -8,11 +8,18 @@ import io
 import shutil
 import json
 import pickle
-from typing import Optional, Tuple, List, Dict, Any
+import tempfile
+import threading
+from typing import Optional, Tuple, List, Dict, Any, Iterable
 
 BASE_STORAGE_DIR = os.path.join("storage", "data")
 TEMP_DIR = os.path.join("storage", "temp")
 EMBEDDING_CACHE_DIR = os.path.join("storage", "embeddings")
+# Per-user "<sha256>\t<size>\t<mtime_ns>\t<cached path>" lines used to spot duplicate downloads
+CONTENT_INDEX_NAME = "content_index.tsv"
+
+_content_index: Dict[str, Tuple[Dict[str, str], Dict[str, Tuple[str, int, int]]]] = {}
+_content_index_lock = threading.Lock()
 
 os.makedirs(BASE_STORAGE_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
@@ -35,10 +42,142 @@ def get_user_embedding_cache_dir(user_id: str) -> str:
 
 def save_bytes_to_cache(user_id: str, folder_id: str, filename: str, data: bytes) -> str:
 	"""Save binary data to the user's cache and return absolute file path."""
+	return stream_to_cache(user_id, folder_id, filename, (data,))
+
+def stream_to_cache(user_id: str, folder_id: str, filename: str, chunks: Iterable[bytes]) -> str:
+	"""Write an iterable of byte chunks to the user's cache and return the file path.
+	Data lands in a temporary file first so an interrupted download is never mistaken for a cached one,
+	and the final rename gives the path a new inode so files hard-linked to the old one are left intact."""
 	cache_dir = get_user_cache_dir(user_id, folder_id)
 	target_path = os.path.join(cache_dir, filename)
-	with open(target_path, "wb") as f:
-		f.write(data)
+	# Unique per writer: a Drive folder can hold two files with the same name
+	fd, partial_path = tempfile.mkstemp(dir=cache_dir, prefix=filename + ".", suffix=".part")
+	try:
+		with os.fdopen(fd, "wb") as f:
+			for chunk in chunks:
+				if chunk:
+					f.write(chunk)
+		_forget_content_path(user_id, target_path)
+		os.replace(partial_path, target_path)
+	except BaseException:
+		if os.path.exists(partial_path):
+			os.remove(partial_path)
+		raise
+	return target_path
+
+def _content_index_path(user_id: str) -> str:
+	"""Return the path of the user's content-hash index file."""
+	user_dir = os.path.join(BASE_STORAGE_DIR, user_id.replace("/", "_"))
+	os.makedirs(user_dir, exist_ok=True)
+	return os.path.join(user_dir, CONTENT_INDEX_NAME)
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+	"""Return (size, mtime_ns) of a file, or None if it is gone."""
+	try:
+		st = os.stat(path)
+	except OSError:
+		return None
+	return st.st_size, st.st_mtime_ns
+
+def _load_content_index(user_id: str) -> Tuple[Dict[str, str], Dict[str, Tuple[str, int, int]]]:
+	"""Return the user's (hash -> path, path -> (hash, size, mtime_ns)) index, loading it from disk once.
+	Entries whose file changed since they were recorded are dropped. Caller must hold _content_index_lock."""
+	index = _content_index.get(user_id)
+	if index is None:
+		by_path: Dict[str, Tuple[str, int, int]] = {}
+		index_path = _content_index_path(user_id)
+		if os.path.exists(index_path):
+			with open(index_path, "r", encoding="utf-8") as f:
+				for line in f:
+					fields = line.rstrip("\n").split("\t")
+					if len(fields) != 4:
+						continue
+					content_hash, size, mtime_ns, path = fields
+					by_path[path] = (content_hash, int(size), int(mtime_ns))
+		by_hash: Dict[str, str] = {}
+		for path, (content_hash, size, mtime_ns) in list(by_path.items()):
+			if _file_signature(path) != (size, mtime_ns):
+				del by_path[path]
+			else:
+				by_hash.setdefault(content_hash, path)
+		index = (by_hash, by_path)
+		_content_index[user_id] = index
+	return index
+
+def _forget_content_path(user_id: str, path: str) -> None:
+	"""Drop index entries for a cached path that is about to be overwritten."""
+	with _content_index_lock:
+		by_hash, by_path = _load_content_index(user_id)
+		entry = by_path.pop(path, None)
+		if entry and by_hash.get(entry[0]) == path:
+			_repoint_hash(by_hash, by_path, entry[0])
+
+def _repoint_hash(by_hash: Dict[str, str], by_path: Dict[str, Tuple[str, int, int]], content_hash: str) -> Optional[str]:
+	"""Point a hash at another unchanged file with that content (e.g. a linked duplicate), or drop it."""
+	by_hash.pop(content_hash, None)
+	for path, entry in list(by_path.items()):
+		if entry[0] == content_hash and _current_entry(by_path, path):
+			by_hash[content_hash] = path
+			return path
+	return None
+
+def _current_entry(by_path: Dict[str, Tuple[str, int, int]], path: str) -> Optional[Tuple[str, int, int]]:
+	"""Return the index entry for `path` if the file still matches it, dropping it otherwise."""
+	entry = by_path.get(path)
+	if entry and _file_signature(path) != entry[1:]:
+		del by_path[path]
+		return None
+	return entry
+
+def find_cached_by_hash(user_id: str, content_hash: str) -> Optional[str]:
+	"""Return a cached file path recorded for this content hash, if that file is unchanged since."""
+	with _content_index_lock:
+		by_hash, by_path = _load_content_index(user_id)
+		path = by_hash.get(content_hash)
+		if path is None:
+			return None
+		if _current_entry(by_path, path) is None:
+			return _repoint_hash(by_hash, by_path, content_hash)
+		return path
+
+def get_content_hash(user_id: str, path: str) -> Optional[str]:
+	"""Return the recorded content hash of a cached file, if the file is unchanged since."""
+	with _content_index_lock:
+		by_hash, by_path = _load_content_index(user_id)
+		entry = _current_entry(by_path, path)
+		return entry[0] if entry else None
+
+def record_content_hash(user_id: str, content_hash: str, path: str) -> None:
+	"""Remember that a cached file holds content with this hash (append-only on disk)."""
+	signature = _file_signature(path)
+	if signature is None:
+		return
+	entry = (content_hash, *signature)
+	with _content_index_lock:
+		by_hash, by_path = _load_content_index(user_id)
+		if by_path.get(path) == entry:
+			return
+		by_path[path] = entry
+		source = by_hash.get(content_hash)
+		if source is None or _current_entry(by_path, source) is None:
+			by_hash[content_hash] = path
+		with open(_content_index_path(user_id), "a", encoding="utf-8") as f:
+			f.write(f"{content_hash}\t{entry[1]}\t{entry[2]}\t{path}\n")
+
+def link_cached_file(user_id: str, folder_id: str, filename: str, source_path: str) -> str:
+	"""Make `filename` in the user's cache point at an existing cached file.
+	Uses a hard link so duplicates share storage; falls back to copying."""
+	cache_dir = get_user_cache_dir(user_id, folder_id)
+	target_path = os.path.join(cache_dir, filename)
+	if os.path.exists(target_path):
+		if os.path.samefile(target_path, source_path):
+			return target_path
+		_forget_content_path(user_id, target_path)
+		os.remove(target_path)
+	try:
+		os.link(source_path, target_path)
+	except OSError:
+		shutil.copy2(source_path, target_path)
 	return target_path
 
 def copy_file_to_cache(user_id: str, folder_id: str, source_path: str, target_name: Optional[str] = None) -> str:
@@ -111,12 +250,20 @@ def get_cached_file_path(user_id: str, folder_id: str, filename: str) -> Optiona
 	
 	return None
 
+def embedding_cache_key(photo_ref: str) -> str:
+	"""Return the sanitized name a photo's embedding is cached under (without .pkl).
+	Matches the entries returned by list_cached_embeddings."""
+	# Handle both full paths and filenames
+	if os.path.sep in photo_ref:
+		# Full path provided, extract filename
+		photo_ref = os.path.basename(photo_ref)
+	return photo_ref.replace("/", "_").replace("\\", "_")
+
 def save_embedding_to_cache(user_id: str, photo_ref: str, embedding_data: Any) -> str:
 	"""Save face embedding data to local cache for faster access."""
 	embedding_dir = get_user_embedding_cache_dir(user_id)
 	# Use photo_ref as filename (sanitized)
-	safe_filename = photo_ref.replace("/", "_").replace("\\", "_")
-	embedding_path = os.path.join(embedding_dir, f"{safe_filename}.pkl")
+	embedding_path = os.path.join(embedding_dir, f"{embedding_cache_key(photo_ref)}.pkl")
 	
 	with open(embedding_path, "wb") as f:
 		pickle.dump(embedding_data, f)
@@ -126,13 +273,7 @@ def save_embedding_to_cache(user_id: str, photo_ref: str, embedding_data: Any) -
 def load_embedding_from_cache(user_id: str, photo_ref: str) -> Optional[Any]:
 	"""Load face embedding data from local cache if it exists."""
 	embedding_dir = get_user_embedding_cache_dir(user_id)
-	# Handle both full paths and filenames
-	if os.path.sep in photo_ref:
-		# Full path provided, extract filename
-		photo_ref = os.path.basename(photo_ref)
-	
-	safe_filename = photo_ref.replace("/", "_").replace("\\", "_")
-	embedding_path = os.path.join(embedding_dir, f"{safe_filename}.pkl")
+	embedding_path = os.path.join(embedding_dir, f"{embedding_cache_key(photo_ref)}.pkl")
 	
 	if os.path.exists(embedding_path):
 		try:
@@ -146,13 +287,7 @@ def load_embedding_from_cache(user_id: str, photo_ref: str) -> Optional[Any]:
 def embedding_exists_in_cache(user_id: str, photo_ref: str) -> bool:
 	"""Check if a face embedding already exists in local cache."""
 	embedding_dir = get_user_embedding_cache_dir(user_id)
-	# Handle both full paths and filenames
-	if os.path.sep in photo_ref:
-		# Full path provided, extract filename
-		photo_ref = os.path.basename(photo_ref)
-	
-	safe_filename = photo_ref.replace("/", "_").replace("\\", "_")
-	embedding_path = os.path.join(embedding_dir, f"{safe_filename}.pkl")
+	embedding_path = os.path.join(embedding_dir, f"{embedding_cache_key(photo_ref)}.pkl")
 	return os.path.exists(embedding_path)
 
 def list_cached_embeddings(user_id: str) -> List[str]:
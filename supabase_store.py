@@ -2,7 +2,7 @@
 supabase_store.py - Save and query face embeddings and metadata in Supabase.
 """
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import numpy as np
@@ -44,6 +44,27 @@ def save_face_embedding(user_id: str, photo_ref: str, embedding: np.ndarray) ->
 		return False
 
 
+def save_face_embeddings_batch(user_id: str, items: List[Tuple[str, np.ndarray]]) -> int:
+	"""Persist many (photo_ref, embedding) pairs with a single insert. Returns number saved."""
+	try:
+		if supabase is None:
+			print(f"⚠️  No Supabase client; simulate batch save of {len(items)} embeddings")
+			return len(items)
+		payload = [
+			{
+				'user_id': user_id,
+				'photo_reference': photo_ref,
+				'face_embedding': embedding.tolist(),
+			}
+			for photo_ref, embedding in items
+		]
+		res = supabase.table(FACES_TABLE).insert(payload).execute()
+		return len(res.data or [])
+	except Exception as e:
+		print(f"❌ save_face_embeddings_batch error: {e}")
+		return 0
+
+
 def fetch_embeddings_for_user(user_id: str) -> List[Dict[str, Any]]:
 	"""Fetch all face records for a user."""
 	try:
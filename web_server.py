@@ -6,6 +6,7 @@ Connects HTML frontend to existing Python backend with OAuth integration
 
 from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for
 import os
+import logging
 import tempfile
 import uuid
 import requests
@@ -18,6 +19,16 @@ from search_handler import search_for_person
 from progress_endpoint import create_progress_endpoint
 from local_cache import get_cache_stats
 
+# Per-file pipeline logging is off by default; set LOG_LEVEL=INFO or DEBUG to see it
+log_level = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+if not isinstance(logging.getLevelName(log_level), int):
+    print(f"⚠️ Unknown LOG_LEVEL {log_level!r}, using WARNING")
+    log_level = 'WARNING'
+logging.basicConfig(
+    level=log_level,
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'  # Change this in production
 